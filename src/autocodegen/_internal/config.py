@@ -1,15 +1,18 @@
 # Hey Emacs, this is -*- coding: utf-8 -*-
 
-import copy
+import logging
+import os
 from pathlib import Path
 from typing import Any, Self, cast
 
 from pydantic import BaseModel, ConfigDict
 
+logger = logging.getLogger(__name__)
+
 
 class BaseModelNoExtra(BaseModel):
     model_config = (  # pyright: ignore[reportUnannotatedClassAttribute]
-        ConfigDict(extra="forbid")
+        ConfigDict(extra="forbid", defer_build=True)
     )
 
 
@@ -71,10 +74,12 @@ class ProjectConfig(BaseModelNoExtra):
         templates_root: Path,
         project_name_default: str | None = None,
     ) -> Self:
-        data_processed = copy.deepcopy(data)
+        # Only "autocodegen" and "templates" entries are mutated below, so
+        # shallow-copy just those instead of deep-copying the whole config
+        data_processed = dict(data)
 
-        autocodegen: dict[str, Any] = (  # pyright: ignore[reportAny, reportExplicitAny]
-            data_processed.pop("autocodegen", {})
+        autocodegen: dict[str, Any] = dict(  # pyright: ignore[reportExplicitAny]
+            data_processed.pop("autocodegen", {}),  # pyright: ignore[reportAny]
         )  # fmt: skip
 
         autocodegen_templates_root = cast(
@@ -120,23 +125,41 @@ class ProjectConfig(BaseModelNoExtra):
 
         data_processed["autocodegen"] = autocodegen
 
-        if "templates" not in data_processed:
-            data_processed["templates"] = {}
-
-        templates_from_dirs = {
-            item.name: {"bootstrap": {"target_dir": "."}}
-            for item in sorted(templates_root.iterdir())
-            if item.is_dir() and item.name not in data_processed["templates"]
-        }
+        templates: dict[TemplateName, dict[str, Any]] = {  # pyright: ignore[reportExplicitAny]
+            name: dict(template)  # pyright: ignore[reportAny]
+            for [name, template] in data_processed.get("templates", {}).items()  # pyright: ignore[reportAny]
+        }  # fmt: skip
 
-        _ = data_processed["templates"].update(  # pyright: ignore[reportUnknownMemberType]
-            templates_from_dirs,
-        )  # fmt: skip
-
-        for [_, template] in data_processed["templates"].items():  # pyright: ignore[reportUnknownVariableType] # fmt: skip
+        for template in templates.values():
             if "project_name" not in template:
-                pn = cast("str", data_processed["autocodegen"]["project_name"])
+                pn = cast("str", autocodegen["project_name"])
                 template["project_name"] = pn
 
-        print(data_processed)
-        return cls.model_validate(data_processed)
+        data_processed["templates"] = templates
+
+        logger.debug("Validating acg config: %s", data_processed)
+        config = cls.model_validate(data_processed)
+
+        # Templates discovered from templates_root sub-directories are
+        # built from trusted, self-generated values only, so they skip
+        # validation with model_construct(). User-supplied template configs
+        # must always go through the validation above.
+        with os.scandir(templates_root) as entries:
+            # Configured names first: cheaper than is_dir() on symlinks
+            template_dir_names = sorted(
+                e.name
+                for e in entries
+                if e.name not in config.templates and e.is_dir()
+            )
+
+        for name in template_dir_names:
+            bootstrap = ProjectConfigTemplateBootstrap.model_construct(
+                target_dir=Path(),
+            )
+
+            config.templates[name] = ProjectConfigTemplate.model_construct(
+                project_name=config.autocodegen.project_name,
+                bootstrap=bootstrap,
+            )
+
+        return config
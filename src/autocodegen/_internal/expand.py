@@ -1,12 +1,13 @@
 # Hey Emacs, this is -*- coding: utf-8 -*-
 
-import importlib.util
+import hashlib
+import itertools
 import os
 import shutil
-import subprocess
 from enum import StrEnum
 from inspect import isfunction
 from pathlib import Path
+from types import CodeType, ModuleType
 from typing import TYPE_CHECKING, Literal, NamedTuple, Self, cast
 
 from mako.lookup import (  # pyright: ignore [reportMissingTypeStubs]
@@ -17,7 +18,6 @@ from . import utils
 
 if TYPE_CHECKING:
     from collections.abc import Callable
-    from types import ModuleType
 
     from .config import ProjectConfig, ProjectConfigTemplate
 
@@ -92,21 +92,54 @@ def import_module_from_file(
     if not mod_path.is_file():
         raise ModuleDynamicImportError(mod_path)
 
-    mod_name = mod_name or mod_path.stem
-    spec = importlib.util.spec_from_file_location(mod_name, mod_path)
+    # gen/renamer modules are plain single files, so the importlib spec
+    # and loader machinery is not needed to execute them
+    module = ModuleType(mod_name or mod_path.stem)
+    module.__file__ = str(mod_path)
 
-    if spec is None or spec.loader is None:
-        raise ModuleDynamicImportError(mod_path)
-
-    module = importlib.util.module_from_spec(spec)
     try:
-        spec.loader.exec_module(module)
+        code = _compile_module_source(mod_path.read_bytes(), str(mod_path))
+        exec(code, module.__dict__)  # noqa: S102
     except Exception as exc:
         raise ModuleDynamicImportError(mod_path) from exc
 
     return module
 
 
+# Compiled module code by source hash. Template trees often carry many
+# copies of the same gen/renamer module, which are compiled only once.
+_code_cache: dict[bytes, CodeType] = {}
+
+
+def _compile_module_source(source: bytes, file_name: str) -> CodeType:
+    digest = hashlib.blake2b(source, digest_size=16).digest()
+
+    code = _code_cache.get(digest)
+    if code is None:
+        code = compile(source, file_name, "exec", dont_inherit=True)
+        _code_cache[digest] = code
+        return code
+
+    # Keep tracebacks pointing at the file actually being imported
+    return _replace_code_file_name(code, file_name)
+
+
+def _replace_code_file_name(code: CodeType, file_name: str) -> CodeType:
+    if code.co_filename == file_name:
+        return code
+
+    consts = tuple(
+        (
+            _replace_code_file_name(const, file_name)
+            if isinstance(const, CodeType)
+            else const
+        )
+        for const in cast("tuple[object, ...]", code.co_consts)
+    )
+
+    return code.replace(co_filename=file_name, co_consts=consts)
+
+
 def import_generate_func(gen_mod_path: Path) -> GenerateFunc:
     gen_mod = import_module_from_file(gen_mod_path)
 
@@ -156,27 +189,138 @@ def get_rename_destination_path(
     return dest_path_str
 
 
-def get_paths_by_ext(
+class PathsByExtQuery(NamedTuple):
+    ext: str
+    with_dirs: bool
+    templates_root: Path
+
+
+class FoundPath(NamedTuple):
+    path: Path
+    is_dir: bool  # As classified by the walk, no extra stat() needed
+    walk_order: int  # Position in the walk, shared by all queries
+
+
+def get_paths_by_exts(
+    *,
+    target_root: Path,
+    queries: list[PathsByExtQuery],
+) -> dict[str, list[FoundPath]]:
+    """Collect paths for several extensions in a single target_root walk."""
+    result: dict[str, list[FoundPath]] = {query.ext: [] for query in queries}
+    walk_order = itertools.count()
+
+    # Longest extension first, so each name lands in its most specific bucket
+    queries_sorted = sorted(queries, key=lambda q: len(q.ext), reverse=True)
+
+    # Plain string checks: no Path objects for entries that do not match
+    file_queries = [
+        (query.ext, str(query.templates_root) + os.sep)
+        for query in queries_sorted
+    ]
+
+    dir_queries = [
+        (query.ext, str(query.templates_root) + os.sep)
+        for query in queries_sorted
+        if query.with_dirs
+    ]
+
+    # Single str.endswith(tuple) call rejects most names up front
+    file_exts = tuple(ext for ext, _ in file_queries)
+    dir_exts = tuple(ext for ext, _ in dir_queries)
+
+    def _add_matching(
+        root_prefix: str,
+        names: list[str],
+        exts: tuple[str, ...],
+        ext_queries: list[tuple[str, str]],
+        *,
+        is_dir: bool,
+    ) -> None:
+        for name in names:
+            if not name.endswith(exts):
+                continue
+
+            for ext, templates_root_prefix in ext_queries:
+                if not name.endswith(ext):
+                    continue
+
+                path_str = root_prefix + name
+
+                if not (path_str + os.sep).startswith(templates_root_prefix):
+                    found = FoundPath(Path(path_str), is_dir, next(walk_order))
+                    result[ext].append(found)
+
+                break
+
+    templates_root_prefixes = [prefix for _, prefix in file_queries]
+
+    def _is_excluded_by_all(dir_prefix: str) -> bool:
+        return all(
+            dir_prefix.startswith(templates_root_prefix)
+            for templates_root_prefix in templates_root_prefixes
+        )
+
+    for root, dir_names, file_names in os.walk(target_root):
+        root_prefix = os.path.join(root, "")  # noqa: PTH118
+
+        _add_matching(
+            root_prefix,
+            file_names,
+            file_exts,
+            file_queries,
+            is_dir=False,
+        )
+
+        if dir_queries:
+            _add_matching(
+                root_prefix,
+                dir_names,
+                dir_exts,
+                dir_queries,
+                is_dir=True,
+            )
+
+        # Do not walk into sub-trees that every query excludes
+        dir_names[:] = [
+            dir_name
+            for dir_name in dir_names
+            if not _is_excluded_by_all(root_prefix + dir_name + os.sep)
+        ]
+
+    return result
+
+
+def find_pycache_dirs(
     *,
     target_root: Path,
-    ext: str,
-    with_dirs: bool,
     templates_root: Path,
 ) -> list[Path]:
+    """Find __pycache__ directories in target_root outside templates_root.
+
+    Found directories are not walked into, as they are removed as a whole.
+    """
+    templates_root_prefix = str(templates_root) + os.sep
     result: list[Path] = []
 
-    for root, dir_names, file_names in os.walk(target_root):
-        names = file_names
-        if with_dirs:
-            names += dir_names
-
-        result += [
-            Path(root) / file_name
-            for file_name in file_names
-            if (
-                file_name.endswith(ext)
-                and not (Path(root) / file_name).is_relative_to(templates_root)
-            )
+    def _is_excluded(dir_path_str: str) -> bool:
+        return (dir_path_str + os.sep).startswith(templates_root_prefix)
+
+    for root, dir_names, _ in os.walk(target_root):
+        root_prefix = os.path.join(root, "")  # noqa: PTH118
+
+        if "__pycache__" in dir_names:
+            dir_names.remove("__pycache__")
+            pycache_path_str = root_prefix + "__pycache__"
+
+            if not _is_excluded(pycache_path_str):
+                result.append(Path(pycache_path_str))
+
+        # Do not walk into templates_root, as get_paths_by_exts() does
+        dir_names[:] = [
+            dir_name
+            for dir_name in dir_names
+            if not _is_excluded(root_prefix + dir_name)
         ]
 
     return result
@@ -226,8 +370,7 @@ def expand_gen(
         raise
 
     try:
-        with Path.open(target_file_path, "w") as file:
-            _ = file.write(target_str)
+        _ = target_file_path.write_bytes(target_str.encode())
     except Exception as exc:
         exc.add_note(f"Failed writing to target file: {target_file_path}")
         raise
@@ -245,20 +388,17 @@ def is_project_self_defence(
     project_config: ProjectConfig,
     target_path: Path,
 ) -> bool:
-    if target_path == project_config.autocodegen.templates_root:
+    templates_root = project_config.autocodegen.templates_root
+
+    if target_path == templates_root:
         return False
 
-    if is_file_in_directory(
-        target_path,
-        project_config.autocodegen.templates_root,
-    ):
+    if is_file_in_directory(target_path, templates_root):
         for [
             template_name,
             template_config,
         ] in project_config.templates.items():
-            template_path = (
-                project_config.autocodegen.templates_root / template_name
-            )
+            template_path = templates_root / template_name
 
             if is_file_in_directory(target_path, template_path):
                 return template_config.bootstrap.self_defence
@@ -276,58 +416,56 @@ def is_workspace_self_defence(ctx: Context, target_path: Path) -> bool:
     return False
 
 
-def compute_dst_path(src_path: Path, src_root: Path, dst_root: Path) -> Path:
-    src_path_abs = src_path.resolve(strict=True)
-    src_root_abs = src_root.resolve(strict=True)
-    dst_root_abs = dst_root.resolve()
-
-    origin_rel = src_path_abs.relative_to(src_root_abs)
+def compute_dst_path(
+    src_path: Path,
+    src_root_abs: Path,
+    dst_root_abs: Path,
+) -> Path:
+    """Map src_path from src_root_abs to dst_root_abs (both resolved)."""
+    origin_rel = src_path.resolve(strict=True).relative_to(src_root_abs)
 
     return dst_root_abs / origin_rel
 
 
-def expand_gen_all(ctx: Context, gen_ext: GenExt) -> None:
-    gen_mod_paths = get_paths_by_ext(
-        target_root=ctx.target_root,
-        ext=gen_ext,
-        with_dirs=False,
-        templates_root=ctx.project_config.autocodegen.templates_root,
-    )
+def expand_gen_all(
+    ctx: Context,
+    gen_ext: GenExt,
+    gen_mod_paths: list[Path],
+) -> list[Path]:
+    if not gen_mod_paths:
+        return []
+
+    print(f"Expanding from '{gen_ext}' templates:")
 
-    if gen_mod_paths:
-        print(f"Expanding from '{gen_ext}' templates:")
+    # Every path is known to end with gen_ext, so a plain slice will do
+    gen_ext_len = len(gen_ext)
+
+    target_file_paths: list[Path] = []
 
     for gen_mod_path in gen_mod_paths:
-        target_file_path_str = str(gen_mod_path).removesuffix(gen_ext)
-        target_file_path = Path(target_file_path_str)
+        target_file_path = Path(str(gen_mod_path)[:-gen_ext_len])
+        target_file_paths.append(target_file_path)
 
         print(f"  {target_file_path}")
         expand_gen(ctx, gen_mod_path, target_file_path)
         shutil.copystat(gen_mod_path, target_file_path)
-
-    for gen_mod_path in gen_mod_paths:
         gen_mod_path.unlink()
 
+    return target_file_paths
 
-def process_renames(ctx: Context, ren_ext: RenExt) -> None:
-    templates_root = (
-        ctx.project_config.autocodegen.templates_root / ctx.template_name
-    )
-
-    orig_paths = get_paths_by_ext(
-        target_root=ctx.target_root,
-        ext=ren_ext,
-        with_dirs=True,
-        templates_root=templates_root,
-    )
 
+def process_renames(
+    ctx: Context,
+    ren_ext: RenExt,
+    orig_paths: list[FoundPath],
+) -> None:
     if orig_paths:
         print(f"Renaming '{ren_ext}':")
 
     dirs_to_move: list[tuple[str, str]] = []
 
     # Move files first
-    for orig_path in orig_paths:
+    for orig_path, orig_is_dir, _ in orig_paths:
         orig_path_str = str(orig_path)
 
         dest_path_str = get_rename_destination_path(
@@ -337,25 +475,100 @@ def process_renames(ctx: Context, ren_ext: RenExt) -> None:
             delete_renamer=True,
         )
 
-        if not orig_path.is_dir():
+        if not orig_is_dir:
             print(f"  {dest_path_str}")
-            _ = shutil.move(orig_path, dest_path_str)
-            # shutil.copy2(orig_path, dest_path_str)
-            # orig_path.unlink()
+
+            try:
+                _ = orig_path.replace(dest_path_str)
+            except OSError:
+                # E.g. cross-device rename or an existing dest directory
+                _ = shutil.move(orig_path, dest_path_str)
         else:
             dirs_to_move.append((orig_path_str, dest_path_str))
 
     # Then move directories
     for orig_dir_path_str, dest_dir_path_str in dirs_to_move:
         print(f"  {dest_dir_path_str}/")
-        _ = shutil.copytree(
-            orig_dir_path_str,
-            dest_dir_path_str,
-            symlinks=True,
-            dirs_exist_ok=True,
-            ignore_dangling_symlinks=True,
+
+        try:
+            # Single rename if dest does not exist or is an empty directory
+            _ = Path(orig_dir_path_str).replace(dest_dir_path_str)
+        except OSError:
+            # E.g. cross-device rename or dest has content to merge into
+            _ = shutil.copytree(
+                orig_dir_path_str,
+                dest_dir_path_str,
+                symlinks=True,
+                dirs_exist_ok=True,
+                ignore_dangling_symlinks=True,
+            )
+            shutil.rmtree(orig_dir_path_str)
+
+
+def expand_gen_and_renames(
+    ctx: Context,
+    gen_ext: GenExt,
+    ren_ext: RenExt,
+) -> None:
+    """Expand gen_ext generators, then process ren_ext renames.
+
+    Both sets of paths come from a single walk of ctx.target_root. The walk
+    cannot be shared between expansion stages though, since renames move
+    directories and generators add new files to the tree.
+    """
+    templates_root = ctx.project_config.autocodegen.templates_root
+
+    paths = get_paths_by_exts(
+        target_root=ctx.target_root,
+        queries=[
+            PathsByExtQuery(
+                gen_ext,
+                with_dirs=False,
+                templates_root=templates_root,
+            ),
+            PathsByExtQuery(
+                ren_ext,
+                with_dirs=True,
+                templates_root=templates_root / ctx.template_name,
+            ),
+        ],
+    )
+
+    gen_found_paths = paths[gen_ext]
+
+    target_file_paths = expand_gen_all(
+        ctx,
+        gen_ext,
+        [found.path for found in gen_found_paths],
+    )
+
+    ren_paths = {found.path for found in paths[ren_ext]}
+
+    # Generated files can be renamed as well, e.g. "name.ren.gen.py"; they
+    # take the walk position of their gen module
+    generated_orig_paths = [
+        FoundPath(path, is_dir=False, walk_order=gen_found.walk_order)
+        for gen_found, path in zip(
+            gen_found_paths,
+            target_file_paths,
+            strict=True,
         )
-        shutil.rmtree(orig_dir_path_str)
+        if path.name.endswith(ren_ext) and path not in ren_paths
+    ]
+
+    # Renames are processed in walk order, as with a separate walk after
+    # the gen expansion
+    orig_paths = sorted(
+        paths[ren_ext] + generated_orig_paths,
+        key=lambda found: found.walk_order,
+    )
+
+    process_renames(ctx, ren_ext, orig_paths)
+
+
+def remove_dirs(dir_paths: list[Path]) -> None:
+    for dir_path in dir_paths:
+        shutil.rmtree(dir_path, ignore_errors=True)
 
 
 def generate(
@@ -385,23 +598,37 @@ def generate(
         target_root,
     )
 
+    # Resolved once here rather than for every entry copytree visits
+    bootstrap_path_abs = bootstrap_path.resolve()
+    target_root_abs = target_root.resolve()
+
+    workspace_templates_roots = [
+        config.autocodegen.templates_root for config in workspace_configs
+    ]
+
     def _template_files_to_ignore(path: str, names: list[str]) -> set[str]:
         result: set[str] = set()
 
-        for name in names:
-            # print("%%%", name)
-
-            src_path = Path(path) / name
+        dst_dir_path = compute_dst_path(
+            Path(path),
+            bootstrap_path_abs,
+            target_root_abs,
+        )
 
-            dst_path = compute_dst_path(
-                src_path,
-                bootstrap_path,
-                target_root,
-            )
+        # Only entries inside some templates_root can be self-defended
+        is_dst_dir_defended = any(
+            is_file_in_directory(dst_dir_path, workspace_templates_root)
+            for workspace_templates_root in workspace_templates_roots
+        )
 
-            # print(f"*** {src_path} -> {dst_path}")
+        for name in names:
+            src_path = Path(path) / name
+            dst_path = dst_dir_path / name
 
-            if is_workspace_self_defence(ctx, dst_path):
+            if is_dst_dir_defended and is_workspace_self_defence(
+                ctx,
+                dst_path,
+            ):
                 print(f"Preventing acg templates override {dst_path!s}")
                 result.add(name)
 
@@ -427,30 +654,18 @@ def generate(
         )
 
         if init:
-            expand_gen_all(ctx, GenExt.GEN_ONCE)
-            process_renames(ctx, RenExt.REN_ONCE)
+            expand_gen_and_renames(ctx, GenExt.GEN_ONCE, RenExt.REN_ONCE)
 
-        expand_gen_all(ctx, GenExt.GEN)
-        process_renames(ctx, RenExt.REN)
+        expand_gen_and_renames(ctx, GenExt.GEN, RenExt.REN)
 
         # Wipe python cache directories
-        pyc_paths = get_paths_by_ext(
+        pyc_paths = find_pycache_dirs(
             target_root=target_root,
-            ext="__pycache__",
-            with_dirs=True,
             templates_root=templates_root,
         )
 
-        pyc_path_strs = [str(p) for p in pyc_paths]
-
-        # Remove python cache files
-        _ = subprocess.Popen(
-            (
-                'python -c "'
-                "import shutil;"
-                f'[shutil.rmtree(pyc, ignore_errors=True) for pyc in {pyc_path_strs}];"'
-            ),
-            shell=True,
-        )
+        # Remove python cache files before the next template is copied over
+        # the same target tree
+        remove_dirs(pyc_paths)
 
     print()
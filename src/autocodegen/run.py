@@ -18,14 +18,14 @@
 # ]
 # ///
 
-# import json
+import os
 import sys
 import tomllib
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-from autocodegen._internal.config import ProjectConfig, ProjectConfigWorkspace
-from autocodegen._internal.expand import generate
+if TYPE_CHECKING:
+    from autocodegen._internal.config import ProjectConfigWorkspace
 
 
 class AcgDirectoryNotFoundError(RuntimeError):
@@ -35,9 +35,10 @@ class AcgDirectoryNotFoundError(RuntimeError):
 def find_top_project_root(start_path: Path | None = None) -> Path | None:
     """Find the topmost directory containing a subdirectory named 'acg'.
 
-    Traverses upward from the starting path (default: current working directory)
-    and returns the highest-level (closest to root) directory that has an 'acg'
-    subdirectory.
+    Checks the filesystem root first, then the ancestors of the starting path
+    (default: current working directory) from the shallowest down to the
+    starting path itself. Returns the first, i.e. highest-level (closest to
+    root), directory that has an 'acg' subdirectory.
 
     Args:
         start_path: The directory to start searching from. Defaults to cwd().
@@ -48,22 +49,23 @@ def find_top_project_root(start_path: Path | None = None) -> Path | None:
     """
     current: Path = Path.cwd() if start_path is None else start_path
 
+    # Check filesystem root separately, it is the topmost candidate
+    root = Path(current.root)
+    if (root / "acg").is_dir():
+        return root
+
     parents = (
         current.parents
         if current.name == "acg"
         else (current, *current.parents)
     )
 
-    # Collect matches from parents (deepest to shallowest)
-    matches = [p for p in parents if (p / "acg").is_dir()]
-
-    # Check filesystem root separately
-    root = Path(current.root)
-    if (root / "acg").is_dir():
-        matches.append(root)
+    # Walk top-down (shallowest to deepest), so the first match is the topmost
+    for parent in reversed(parents):
+        if parent != root and (parent / "acg").is_dir():
+            return parent
 
-    # Return the topmost (first in the list, since we went bottom-up)
-    return matches[-1] if matches else None
+    return None
 
 
 def find_workspace_acg_dirs(
@@ -119,9 +121,10 @@ def load_acg_config(
 ) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
     """Load the ACG configuration from a TOML file.
 
-    If the file exists, it is parsed using :func:`tomllib.load` and the
-    resulting dictionary is returned. If the file does not exist or is not a
-    regular file, an empty dictionary is returned.
+    If the file exists, it is read in one go and parsed using
+    :func:`tomllib.loads`, and the resulting dictionary is returned. If the
+    file does not exist or is not a regular file, an empty dictionary is
+    returned.
 
     This behaviour allows callers to treat the configuration as optional without
     needing separate existence checks.
@@ -135,16 +138,20 @@ def load_acg_config(
         missing.
 
     Note:
-        The function opens the file in binary mode (``"rb"``) as required by
-        :mod:`tomllib`.
+        The file is read as bytes and decoded as UTF-8, as required by TOML.
 
     """
-    if (acg_config_path).is_file():
-        with Path.open(acg_config_path, "rb") as f:
-            return tomllib.load(f)
-    else:
+    if not acg_config_path.is_file():
         return {}
 
+    return tomllib.loads(acg_config_path.read_bytes().decode())
+
+
+def _file_id(path: Path) -> tuple[int, int]:
+    """Return (st_dev, st_ino) of path, following symlinks."""
+    path_stat = path.stat()
+    return path_stat.st_dev, path_stat.st_ino
+
 
 def is_project_target_empty(
     project_root: Path,
@@ -156,12 +163,15 @@ def is_project_target_empty(
     Returns True if:
       - project_root has no entries at all, or
       - every entry in project_root (files, dirs, hidden included)
-        resolves to the same absolute path as either:
+        is the same file, after following symlinks, as either:
           - templates_root, or
           - one of the paths in members
 
-    Comparison uses resolved absolute paths (strict=True → raises if any path
-    does not exist). All exceptions from iterdir() / resolve() propagate.
+    Comparison uses (st_dev, st_ino) pairs rather than resolved paths, so
+    each path costs a single stat(). A missing path or a dangling symlink
+    raises FileNotFoundError. All exceptions from scandir() / stat()
+    propagate. project_root is read only up to the first entry that is not
+    allowed.
 
     Args:
         project_root:   Directory to check
@@ -173,18 +183,23 @@ def is_project_target_empty(
         False if any entry is not in the allowed set.
 
     """
-    entries = list(project_root.iterdir())
+    allowed: set[tuple[int, int]] | None = None
 
-    if not entries:
-        return True
+    # Stop reading project_root at the first entry that is not allowed
+    with os.scandir(project_root) as entries:
+        for entry in entries:
+            # Allowed paths are all directories, so a plain file is foreign
+            # and can be rejected from the cached d_type, without a stat()
+            if not entry.is_symlink() and not entry.is_dir():
+                return False
 
-    allowed: set[Path] = {templates_root.resolve(strict=True)}
-    allowed.update(m.resolve(strict=True) for m in members)
+            if allowed is None:
+                allowed = {_file_id(templates_root)}
+                allowed.update(_file_id(m) for m in members)
 
-    for entry in entries:
-        resolved = entry.resolve(strict=True)
-        if resolved not in allowed:
-            return False
+            entry_stat = entry.stat()
+            if (entry_stat.st_dev, entry_stat.st_ino) not in allowed:
+                return False
 
     return True
 
@@ -203,6 +218,10 @@ def main() -> int:
         )
         return 1
 
+    # Deferred, so the failure path above does not pay for pydantic models
+    from autocodegen._internal.config import ProjectConfig  # noqa: PLC0415
+    from autocodegen._internal.expand import generate  # noqa: PLC0415
+
     top_templates_root = top_project_root / "acg"
     top_project_config = ProjectConfig.load(
         load_acg_config(top_templates_root / "config.toml"),
@@ -225,14 +244,7 @@ def main() -> int:
         print(f"fatal: {exc}", file=sys.stderr)
         return 1
 
-    # print(
-    #     "+++",
-    #     json.dumps(
-    #         project_config.model_dump(mode="json"),
-    #         indent=2,
-    #         ensure_ascii=False,
-    #     ),
-    # )
+    # print("+++", project_config.model_dump_json(indent=2))
 
     workspace_project_configs = [
         ProjectConfig.load(
@@ -258,7 +270,9 @@ def main() -> int:
     workspace_configs = [top_project_config]
     workspace_configs.extend(workspace_project_configs)
 
-    is_all_project_roots_empty = all(
+    # Init every template on workspace init or when all project roots are
+    # empty; target roots are not scanned when workspace init is set
+    base_init = top_workspace_init or all(
         is_project_target_empty(
             config.autocodegen.project_root,
             config.autocodegen.templates_root,
@@ -268,21 +282,10 @@ def main() -> int:
     )
 
     for project_config in workspace_configs:
-        # print(
-        #     "***",
-        #     json.dumps(
-        #         project_config.model_dump(mode="json"),
-        #         indent=2,
-        #         ensure_ascii=False,
-        #     ),
-        # )
+        # print("***", project_config.model_dump_json(indent=2))
 
         for [name, config] in project_config.templates.items():
-            init = (
-                is_all_project_roots_empty
-                or top_workspace_init
-                or config.bootstrap.init
-            )
+            init = base_init or config.bootstrap.init
 
             generate(
                 name,